@@ -1,3 +1,4 @@
+import os
 import sys
 from datetime import datetime
 
@@ -13,9 +14,9 @@ class StoremonitoringsystemConfig(AppConfig):
 
     def ready(self):
         from .utils.import_data import import_data
-        from .utils.is_importing import set_is_importing
 
-        set_is_importing(False)
-
-        if "runserver" in sys.argv:
+        # The autoreloader runs the server in a child process, start the import there only,
+        # so it shares the is_importing flag with the views
+        serving = os.environ.get("RUN_MAIN") == "true" or "--noreload" in sys.argv
+        if "runserver" in sys.argv and serving:
             import_data()
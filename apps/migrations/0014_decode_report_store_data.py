@@ -0,0 +1,32 @@
+# Generated by Django 4.2.11 on 2026-10-15 10:12
+
+import json
+
+from django.db import migrations
+
+
+def decode_store_data(apps, schema_editor):
+    # Reports used to hold their store data as a JSON encoded string inside the JSONField
+    Report = apps.get_model("apps", "Report")
+    for report in Report.objects.all().iterator():
+        if isinstance(report.store_data, str):
+            report.store_data = json.loads(report.store_data)
+            report.save(update_fields=["store_data"])
+
+
+def encode_store_data(apps, schema_editor):
+    Report = apps.get_model("apps", "Report")
+    for report in Report.objects.all().iterator():
+        if not isinstance(report.store_data, str):
+            report.store_data = json.dumps(report.store_data)
+            report.save(update_fields=["store_data"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("apps", "0013_delete_importingdata"),
+    ]
+
+    operations = [
+        migrations.RunPython(decode_store_data, encode_store_data),
+    ]
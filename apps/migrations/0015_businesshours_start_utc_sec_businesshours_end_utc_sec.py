@@ -0,0 +1,69 @@
+# Generated by Django 4.2.11 on 2026-10-15 11:03
+
+from datetime import date, datetime, timezone
+
+import pytz
+from django.db import migrations, models
+
+# Timezone assumed for stores missing from the Timezone model at the time of this migration
+DEFAULT_TIMEZONE = "America/Chicago"
+
+
+def local_time_to_utc_seconds(local_time, timezone_info, local_date):
+    # Self-contained copy of the conversion as it stood at the time of this migration
+    try:
+        local_timezone = pytz.timezone(timezone_info)
+    except pytz.exceptions.UnknownTimeZoneError:
+        local_timezone = pytz.timezone(DEFAULT_TIMEZONE)
+
+    local_datetime = datetime.combine(local_date, local_time)
+
+    try:
+        localized_datetime = local_timezone.localize(local_datetime, is_dst=None)
+    except pytz.exceptions.InvalidTimeError:
+        localized_datetime = local_timezone.localize(local_datetime, is_dst=False)
+
+    utc_time = localized_datetime.astimezone(timezone.utc).time()
+    return utc_time.hour * 3600 + utc_time.minute * 60 + utc_time.second
+
+
+def fill_business_hours_utc(apps, schema_editor):
+    BusinessHours = apps.get_model("apps", "BusinessHours")
+    Timezone = apps.get_model("apps", "Timezone")
+
+    timezones = dict(Timezone.objects.values_list("store", "timezone_str"))
+    business_hours = list(BusinessHours.objects.all())
+    today = date.today()
+
+    for business_hour in business_hours:
+        timezone_info = timezones.get(business_hour.store, DEFAULT_TIMEZONE)
+        business_hour.start_utc_sec = local_time_to_utc_seconds(
+            business_hour.start_time_local, timezone_info, today
+        )
+        business_hour.end_utc_sec = local_time_to_utc_seconds(
+            business_hour.end_time_local, timezone_info, today
+        )
+
+    BusinessHours.objects.bulk_update(
+        business_hours, ["start_utc_sec", "end_utc_sec"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("apps", "0014_decode_report_store_data"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="businesshours",
+            name="start_utc_sec",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="businesshours",
+            name="end_utc_sec",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.RunPython(fill_business_hours_utc, migrations.RunPython.noop),
+    ]
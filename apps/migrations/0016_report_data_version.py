@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-15 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("apps", "0015_businesshours_start_utc_sec_businesshours_end_utc_sec"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="report",
+            name="data_version",
+            field=models.FloatField(null=True),
+        ),
+    ]
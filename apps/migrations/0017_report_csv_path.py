@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-15 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("apps", "0016_report_data_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="report",
+            name="csv_path",
+            field=models.CharField(max_length=255, null=True),
+        ),
+    ]
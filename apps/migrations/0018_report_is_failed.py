@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-15 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("apps", "0017_report_csv_path"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="report",
+            name="is_failed",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,5 +1,3 @@
-import json
-
 from django.db import models
 
 
@@ -17,6 +15,9 @@ class BusinessHours(models.Model):
     day = models.IntegerField()
     start_time_local = models.TimeField()
     end_time_local = models.TimeField()
+    # Business hours converted to seconds since midnight UTC, filled in at import time
+    start_utc_sec = models.PositiveIntegerField(null=True)
+    end_utc_sec = models.PositiveIntegerField(null=True)
 
     class Meta:
         unique_together = ["store", "day"]
@@ -62,15 +63,23 @@ class Report(models.Model):
     # Django will automatically add an auto-incrementing primary key 'id'
     store_data = models.JSONField(default=list)
     is_completed = models.BooleanField(default=False)
+    # Set when the report could not be generated
+    is_failed = models.BooleanField(default=False)
+    # Timestamp of the data import the report was generated from
+    data_version = models.FloatField(null=True)
+    # Path of the CSV file written once the report is completed
+    csv_path = models.CharField(max_length=255, null=True)
 
     def set_store_data(self, store_reports):
-        # Convert a list of StoreReport instances to a list of dictionaries
-        data_list = [store_report.serialize() for store_report in store_reports]
-        self.store_data = json.dumps(data_list)
+        # Convert a list of StoreReport instances to a list of dictionaries,
+        # the JSONField takes care of serializing it
+        self.store_data = [store_report.serialize() for store_report in store_reports]
+
+    def complete(self, csv_path):
+        # Mark the report as completed along with its store data, CSV path and data version,
+        # the whole report is written in a single UPDATE of these columns
+        self.csv_path = csv_path
         self.is_completed = True
-        self.save()
-
-    def get_store_data(self):
-        # Convert the JSON-serialized store_data back to a list of dictionaries
-        data_list = json.loads(self.store_data)
-        return [StoreReport(**store_data) for store_data in data_list]
+        self.save(
+            update_fields=["store_data", "csv_path", "is_completed", "data_version"]
+        )
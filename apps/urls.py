@@ -1,8 +1,9 @@
 from django.urls import path
 
-from apps.views import trigger_report, get_report
+from apps.views import trigger_report, get_report, download_report
 
 urlpatterns = [
     path("trigger-report/", trigger_report),
     path("get-report/<int:report_id>/", get_report),
+    path("download-report/<int:report_id>/", download_report),
 ]
@@ -1,113 +1,147 @@
-from datetime import date, datetime
-from pytz import timezone, utc
+from datetime import date, datetime, timezone as datetime_timezone
+from functools import lru_cache
+
+from pytz import timezone
+from pytz.exceptions import InvalidTimeError, UnknownTimeZoneError
 
 from apps.models import BusinessHours, Timezone
 
+# Timezone assumed for stores missing from the Timezone model
+DEFAULT_TIMEZONE = "America/Chicago"
+
+# Number of seconds in a day
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Memoized timezone constructor, stores share a handful of timezones
+_get_tz = lru_cache(maxsize=512)(timezone)
+
 
 def get_default_business_hours_data():
     """
-    Returns a list of dictionaries representing default business hours for all days of the week.
-    Each dictionary has two keys: "day" and "start_utc".
-    The "day" key is an integer representing the day of the week (6 for Sunday, 0 for Monday, etc.).
-    The "start_utc" key is a time object representing the start time of the business day in UTC.
+    Returns the default business hours for all days of the week, open 24*7.
+
+    The business hours are laid out as two lists indexed by the day of the week (0 for Monday, 6 for Sunday):
+    the start and the end of the business day, in seconds since midnight UTC.
     """
-    return [
-        {
-            "day": day,
-            "start_utc": datetime.strptime("00:00:00", "%H:%M:%S").time(),
-            "end_utc": datetime.strptime("23:59:59", "%H:%M:%S").time(),
-        }
-        for day in range(7)
-    ]
+    return [0] * 7, [SECONDS_PER_DAY - 1] * 7
 
 
-def convert_local_time_to_utc(local_time, timezone_info):
+def convert_local_time_to_utc(local_time, timezone_info, local_date=None):
     """
     Converts a local time to UTC.
 
     Args:
         local_time (datetime): The local time to convert.
-        timezone_info (str): The timezone information.
+        timezone_info (str): The timezone information, the default timezone is used if it is unknown.
+        local_date (date, optional): The date the local time falls on. Defaults to today.
 
     Returns:
         datetime: The UTC time.
     """
-    local_timezone = timezone(timezone_info)
-    local_datetime = datetime.combine(date.today(), local_time)
-    localized_datetime = local_timezone.localize(local_datetime, is_dst=None)
+    try:
+        local_timezone = _get_tz(timezone_info)
+    except UnknownTimeZoneError:
+        # Unknown timezones are treated like missing ones
+        local_timezone = _get_tz(DEFAULT_TIMEZONE)
+
+    local_datetime = datetime.combine(local_date or date.today(), local_time)
+
+    try:
+        localized_datetime = local_timezone.localize(local_datetime, is_dst=None)
+    except InvalidTimeError:
+        # Times that are ambiguous or skipped on a DST transition day are taken as standard time
+        localized_datetime = local_timezone.localize(local_datetime, is_dst=False)
 
     # Convert to UTC
-    return localized_datetime.astimezone(utc).time()
+    return localized_datetime.astimezone(datetime_timezone.utc).time()
 
 
-def convert_business_hours_to_utc(store_id, start_time_local, end_time_local):
+def time_to_seconds(value):
+    """
+    Converts a time to the number of seconds since midnight.
+
+    Args:
+        value (time): The time to convert.
+
+    Returns:
+        int: The number of seconds since midnight.
+    """
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def convert_business_hours_to_utc(timezone_info, start_time_local, end_time_local):
     """
     Converts local business hours to UTC.
 
     Args:
-        store_id (int): The ID of the store.
+        timezone_info (str): The timezone information of the store.
         start_time_local (datetime): The start time of the business day in local time.
         end_time_local (datetime): The end time of the business day in local time.
 
     Returns:
         tuple: A tuple of two time objects representing the start and end times of the business day in UTC.
     """
-    timezone_info = get_timezone_info_for_store(store_id)
-    start_utc = convert_local_time_to_utc(start_time_local, timezone_info)
-    end_utc = convert_local_time_to_utc(end_time_local, timezone_info)
+    today = date.today()
+    start_utc = convert_local_time_to_utc(start_time_local, timezone_info, today)
+    end_utc = convert_local_time_to_utc(end_time_local, timezone_info, today)
     return start_utc, end_utc
 
 
-def get_timezone_info_for_store(store_id):
+def get_business_hours_for_stores():
     """
-    Retrieves the timezone information for a store.
+    Retrieves the business hours of every store at once.
 
-    Args:
-        store_id (int): The ID of the store.
+    This issues a single query for the whole table, as reports cover nearly every store anyway.
+    Stores without business hours are left out, they are open 24*7.
 
     Returns:
-        str: The timezone information.
+        dict: A dictionary mapping each store ID to two tuples holding the start and end of its business hours
+        for each day of the week, in seconds since midnight UTC.
     """
-    try:
-        # Get the timezone information from the Timezone model
-        timezone_obj = Timezone.objects.get(store=store_id)
-        return timezone_obj.timezone_str
-    except Timezone.DoesNotExist:
-        # If timezone information is missing, assume America/Chicago
-        return "America/Chicago"
+    business_hours_by_store = {}
 
+    # Fetch the business hours of all the stores up front, as plain tuples rather than model instances
+    business_hours = BusinessHours.objects.filter(
+        start_utc_sec__isnull=False
+    ).values_list("store", "day", "start_utc_sec", "end_utc_sec")
 
-def get_business_hours_by_store(store_id):
-    """
-    Retrieves the business hours for a store.
+    for store_id, day, start_utc_sec, end_utc_sec in business_hours:
+        if store_id not in business_hours_by_store:
+            business_hours_by_store[store_id] = get_default_business_hours_data()
 
-    Args:
-        store_id (int): The ID of the store.
+        # Update the corresponding entry in the business hours data of the store
+        starts, ends = business_hours_by_store[store_id]
+        starts[day] = start_utc_sec
+        ends[day] = end_utc_sec
 
-    Returns:
-        list: A list of dictionaries representing the business hours for the store.
+    return {
+        store_id: (tuple(starts), tuple(ends))
+        for store_id, (starts, ends) in business_hours_by_store.items()
+    }
+
+
+def update_business_hours_utc():
     """
-    business_hours_data = get_default_business_hours_data()
+    Converts the local business hours of every store to UTC and saves them as seconds since midnight.
 
-    # Try to retrieve the business hours from the BusinessHours model
-    try:
-        business_hours = BusinessHours.objects.filter(store=store_id)
-    except BusinessHours.DoesNotExist:
-        # If no business hours data is found, assume it is open 24*7
-        return business_hours_data
+    This is run once the business hours and timezones have been imported, so that reports never need
+    to do any timezone conversion.
+    """
+    timezones = dict(Timezone.objects.values_list("store", "timezone_str"))
+    business_hours = list(
+        BusinessHours.objects.only("store", "start_time_local", "end_time_local")
+    )
 
-    # Update the default business hours data with the retrieved business hours
     for business_hour in business_hours:
         # Convert the local business hours to UTC
         start_utc, end_utc = convert_business_hours_to_utc(
-            store_id,
+            timezones.get(business_hour.store, DEFAULT_TIMEZONE),
             business_hour.start_time_local,
             business_hour.end_time_local,
         )
+        business_hour.start_utc_sec = time_to_seconds(start_utc)
+        business_hour.end_utc_sec = time_to_seconds(end_utc)
 
-        # Update the corresponding entry in the business_hours_data list
-        entry_index = business_hour.day
-        business_hours_data[entry_index]["start_utc"] = start_utc
-        business_hours_data[entry_index]["end_utc"] = end_utc
-
-    return business_hours_data
+    BusinessHours.objects.bulk_update(
+        business_hours, ["start_utc_sec", "end_utc_sec"], batch_size=1000
+    )
@@ -1,5 +1,20 @@
 import csv
 import os
+from operator import itemgetter
+
+# Columns of the report CSV, in order
+CSV_FIELD_NAMES = (
+    "store",
+    "uptime_last_hour",
+    "uptime_last_day",
+    "uptime_last_week",
+    "downtime_last_hour",
+    "downtime_last_day",
+    "downtime_last_week",
+)
+
+# Size of the write buffer of the report CSV file (1 MiB)
+CSV_WRITE_BUFFER_SIZE = 1024 * 1024
 
 
 def generate_csv_and_return_path(report):
@@ -12,26 +27,75 @@ def generate_csv_and_return_path(report):
     Returns:
         str: The path to the generated CSV file.
     """
-    csv_generator = CSVGenerator(report.id, report.get_store_data())
+    csv_generator = CSVGenerator(report.id, report.store_data)
     csv_path = csv_generator.generate_csv()
     return csv_path
 
 
+def get_csv_rows(store_data):
+    """
+    Builds the CSV row of each store report, with the values in the order of CSV_FIELD_NAMES.
+
+    The rows are read straight from the serialized store reports, without rebuilding StoreReport objects.
+
+    Args:
+        store_data (iterable): The serialized store reports containing the data to be exported.
+
+    Returns:
+        iterator: An iterator yielding a tuple of values for each store report.
+    """
+    return map(itemgetter(*CSV_FIELD_NAMES), store_data)
+
+
+def stream_csv(report):
+    """
+    Lazily renders the report data as CSV, one line at a time.
+
+    Args:
+        report (object): The report object containing the data to be exported.
+
+    Returns:
+        generator: A generator yielding the CSV header line followed by one line per store report.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_FIELD_NAMES)
+    for row in get_csv_rows(report.store_data):
+        yield writer.writerow(row)
+
+
+class Echo:
+    """
+    Pseudo file whose write method returns the written value instead of storing it.
+    """
+
+    def write(self, value):
+        """
+        Returns the value to be written.
+
+        Args:
+            value (str): The value written by the CSV writer.
+
+        Returns:
+            str: The same value.
+        """
+        return value
+
+
 class CSVGenerator:
     """
     Class responsible for generating CSV files from report data.
     """
 
-    def __init__(self, report_id, store_reports):
+    def __init__(self, report_id, store_data):
         """
         Initializes the CSVGenerator object with the report ID and store reports data.
 
         Args:
             report_id (int): The unique identifier of the report.
-            store_reports (list): A list of store report objects containing the data to be exported.
+            store_data (list): A list of serialized store reports containing the data to be exported.
         """
         self.report_id = report_id
-        self.store_reports = store_reports
+        self.store_data = store_data
 
     def generate_csv(self):
         """
@@ -43,40 +107,29 @@ class CSVGenerator:
         csv_filename = f"{self.report_id}.csv"
         csv_path = os.path.join("csv_data", csv_filename)
 
-        with open(csv_path, "w", newline="") as csv_file:
-            self._write_csv_header(csv_file)
-            self._write_csv_data(csv_file)
+        with open(
+            csv_path, "w", newline="", buffering=CSV_WRITE_BUFFER_SIZE
+        ) as csv_file:
+            writer = csv.writer(csv_file)
+            self._write_csv_header(writer)
+            self._write_csv_data(writer)
 
         return csv_path
 
-    def _write_csv_header(self, csv_file):
+    def _write_csv_header(self, writer):
         """
         Writes the CSV header row to the file.
 
         Args:
-            csv_file (file): The open CSV file object.
+            writer (csv.writer): The writer of the open CSV file.
         """
-        field_names = [
-            "store",
-            "uptime_last_hour",
-            "uptime_last_day",
-            "uptime_last_week",
-            "downtime_last_hour",
-            "downtime_last_day",
-            "downtime_last_week",
-        ]
-        writer = csv.DictWriter(csv_file, fieldnames=field_names)
-        writer.writeheader()
-
-    def _write_csv_data(self, csv_file):
+        writer.writerow(CSV_FIELD_NAMES)
+
+    def _write_csv_data(self, writer):
         """
         Writes each store report data as a row to the CSV file.
 
         Args:
-            csv_file (file): The open CSV file object.
+            writer (csv.writer): The writer of the open CSV file.
         """
-        for store_report in self.store_reports:
-            writer = csv.DictWriter(
-                csv_file, fieldnames=store_report.serialize().keys()
-            )
-            writer.writerow(store_report.serialize())
+        writer.writerows(get_csv_rows(self.store_data))
@@ -2,19 +2,29 @@ import csv
 import os
 import threading
 import time
-from datetime import datetime, timezone
+from datetime import datetime, time as datetime_time, timezone
+from itertools import islice
 from multiprocessing import Process
 
 from decouple import config
+from django.conf import settings
+from django.db import connections
 from tqdm import tqdm
 
 from apps.models import *
-from .is_importing import set_is_importing
+from .business_hours import update_business_hours_utc
+from .is_importing import importing, set_last_import
 
 BUSINESS_HOURS_CSV_PATH = config("BUSINESS_HOURS_CSV_PATH")
 STORES_CSV_PATH = config("STORES_CSV_PATH")
 TIMEZONES_CSV_PATH = config("TIMEZONES_CSV_PATH")
 
+# Timezone of the timestamps in the stores CSV
+UTC = timezone.utc
+
+# Number of objects built and written to the database at a time during an import
+IMPORT_BATCH_SIZE = 100000
+
 
 def clear_database():
     """
@@ -29,27 +39,52 @@ def clear_database():
 
 def parse_timestamp(timestamp_str):
     """
-    Converts a timestamp string into a datetime object.
+    Converts a UTC timestamp string into a timezone aware datetime object.
 
     Args:
         timestamp_str (str): The timestamp string to convert.
 
     Returns:
-        datetime: The parsed datetime object.
+        datetime: The parsed datetime object, in UTC.
 
     Raises:
         ValueError: If the timestamp string format is not recognized.
     """
-    timestamp_formats = ["%Y-%m-%d %H:%M:%S.%f %Z", "%Y-%m-%d %H:%M:%S %Z"]
-
-    for timestamp_format in timestamp_formats:
+    # Fast path: timestamps are written as ISO dates with a trailing UTC suffix
+    if timestamp_str.endswith(" UTC"):
         try:
-            timestamp_utc = datetime.strptime(timestamp_str, timestamp_format)
-            return timestamp_utc
+            return datetime.fromisoformat(timestamp_str[:-4]).replace(tzinfo=UTC)
         except ValueError:
             pass
 
-    raise ValueError(f"Timestamp format not recognized: {timestamp_str}")
+    # Pick the format from the presence of microseconds instead of probing each one
+    timestamp_format = (
+        "%Y-%m-%d %H:%M:%S.%f %Z" if "." in timestamp_str else "%Y-%m-%d %H:%M:%S %Z"
+    )
+
+    try:
+        return datetime.strptime(timestamp_str, timestamp_format).replace(tzinfo=UTC)
+    except ValueError:
+        raise ValueError(f"Timestamp format not recognized: {timestamp_str}") from None
+
+
+def parse_time(time_str):
+    """
+    Converts a HH:MM:SS time string into a time object.
+
+    Splitting the fixed format by hand is much cheaper than going through strptime.
+
+    Args:
+        time_str (str): The time string to convert.
+
+    Returns:
+        time: The parsed time object.
+
+    Raises:
+        ValueError: If the time string is not a valid HH:MM:SS time.
+    """
+    hour, minute, second = map(int, time_str.split(":"))
+    return datetime_time(hour, minute, second)
 
 
 def load_csv_data(csv_path, model, create_objects):
@@ -59,7 +94,7 @@ def load_csv_data(csv_path, model, create_objects):
     Args:
         csv_path (str): The path to the CSV file.
         model (Model): The model class corresponding to the CSV data.
-        create_objects (function): A function that takes a list of CSV data rows and returns a list of corresponding model objects.
+        create_objects (function): A function that takes an iterator of CSV data rows and returns an iterable of corresponding model objects.
 
     Raises:
         FileNotFoundError: If the CSV file does not exist.
@@ -70,8 +105,11 @@ def load_csv_data(csv_path, model, create_objects):
     with open(csv_path, "r") as csv_file:
         csv_data = csv.reader(csv_file)
         next(csv_data)  # Skip the header row
-        objects = create_objects(csv_data)
-        model.objects.bulk_create(objects, batch_size=100000)
+        objects = iter(create_objects(csv_data))
+
+        # Build and write the objects one batch at a time to keep memory usage flat
+        while batch := list(islice(objects, IMPORT_BATCH_SIZE)):
+            model.objects.bulk_create(batch)
 
 
 def load_db_from_csv(store_csv_path, business_hours_csv_path, timezone_csv_path):
@@ -102,146 +140,146 @@ def load_db_from_csv(store_csv_path, business_hours_csv_path, timezone_csv_path)
 
     # Import data from CSV files in parallel using multiple processes
     print("Importing data...")
-    set_is_importing(True)
     start_time = time.time()
 
-    clear_database()  # Remove existing data from the database before importing new data
-
-    processes = [
-        Process(
-            target=load_csv_data,
-            args=(store_csv_path, Store, create_store_objects),
-        ),
-        Process(
-            target=load_csv_data,
-            args=(
-                business_hours_csv_path,
-                BusinessHours,
-                create_business_hours_objects,
+    # The flag is cleared even if the import fails, so the API does not stay locked
+    with importing():
+        clear_database()  # Remove existing data from the database before importing new data
+
+        # Let each process open its own database connection instead of sharing this one
+        connections.close_all()
+
+        processes = [
+            Process(
+                target=load_csv_data,
+                args=(store_csv_path, Store, create_store_objects),
             ),
-        ),
-        Process(
-            target=load_csv_data,
-            args=(timezone_csv_path, Timezone, create_timezone_objects),
-        ),
-    ]
-
-    for process in processes:
-        process.start()
+            Process(
+                target=load_csv_data,
+                args=(
+                    business_hours_csv_path,
+                    BusinessHours,
+                    create_business_hours_objects,
+                ),
+            ),
+            Process(
+                target=load_csv_data,
+                args=(timezone_csv_path, Timezone, create_timezone_objects),
+            ),
+        ]
 
-    for process in processes:
-        process.join()
+        for process in processes:
+            process.start()
+
+        for process in processes:
+            process.join()
+
+        # Convert the business hours to UTC now that the timezones are known
+        update_business_hours_utc()
+
+        end_time = time.time()
+
+        # Invalidates the reports generated from the previous data
+        set_last_import(end_time)
 
-    end_time = time.time()
     elapsed_time = end_time - start_time
-    set_is_importing(False)
     print(f"Data loaded successfully. Time taken: {elapsed_time:.2f} seconds")
 
 
-def create_store_objects(csv_data):
+def track_progress(csv_data, desc):
     """
-    Creates Store objects from a list of CSV data rows.
+    Wraps CSV data rows in a progress bar, in DEBUG mode only.
 
-    This function iterates through the list of CSV data rows and creates corresponding Store objects.
-    It converts the timestamp from UTC to the specified timezone and sets the is_active flag based on the store status.
+    Outside of DEBUG mode the rows are returned untouched, so the import does not pay for updating
+    the progress bar on every row.
 
     Args:
-        csv_data (list): A list of CSV data rows.
+        csv_data (iterator): An iterator of CSV data rows.
+        desc (str): The description shown next to the progress bar.
 
     Returns:
-        list: A list of Store objects.
+        iterator: An iterator of the same CSV data rows.
     """
+    if settings.DEBUG:
+        return tqdm(csv_data, desc=desc)
+
+    return csv_data
 
-    store_objects = []
-    csv_data = list(csv_data)
-    total_rows = len(csv_data)
 
-    for i, row in tqdm(
-        enumerate(csv_data, 1), total=total_rows, desc="Processing stores"
-    ):
-        store, status, timestamp_utc = row
+def create_store_objects(csv_data):
+    """
+    Creates Store objects from CSV data rows.
 
-        # Parse the timestamp from UTC to the specified timezone
-        timestamp_utc = parse_timestamp(timestamp_utc)
-        timestamp_utc = timestamp_utc.replace(tzinfo=timezone.utc)
+    This function lazily iterates through the CSV data rows and creates corresponding Store objects.
+    It parses the UTC timestamp and sets the is_active flag based on the store status.
 
-        # Convert status to 1 for 'active' and 0 for 'inactive'
-        is_active = True if status.lower() == "active" else False
+    Args:
+        csv_data (iterator): An iterator of CSV data rows.
 
-        # Create a Store object with the parsed data
-        store_objects.append(
-            Store(store=store, timestamp_utc=timestamp_utc, is_active=is_active)
-        )
+    Returns:
+        generator: A generator yielding Store objects.
+    """
 
-    return store_objects
+    for store, status, timestamp_utc in track_progress(csv_data, "Processing stores"):
+        yield Store(
+            store=store,
+            timestamp_utc=parse_timestamp(timestamp_utc),
+            is_active=status.lower() == "active",
+        )
 
 
 def create_business_hours_objects(csv_data):
     """
-    Creates BusinessHours objects from a list of CSV data rows.
+    Creates BusinessHours objects from CSV data rows.
 
-    This function iterates through the list of CSV data rows and creates corresponding BusinessHours objects.
+    This function iterates through the CSV data rows and creates corresponding BusinessHours objects.
     It handles duplicate records by updating existing records instead of creating new ones.
 
     Args:
-        csv_data (list): A list of CSV data rows.
+        csv_data (iterator): An iterator of CSV data rows.
 
     Returns:
-        list: A list of BusinessHours objects.
+        iterable: The BusinessHours objects, in the order their (store, day) first appears.
     """
 
-    business_hours_objects = []
-    existing_records = {}  # Dictionary to store existing records by (store, day) tuple
-    csv_data = list(csv_data)
-    total_rows = len(csv_data)
+    # Dictionary of the BusinessHours objects by (store, day) tuple
+    business_hours_objects = {}
 
-    for i, row in tqdm(
-        enumerate(csv_data, 1), total=total_rows, desc="Processing business hours"
-    ):
+    for row in track_progress(csv_data, "Processing business hours"):
         store, day, start_time_local, end_time_local = row
         day = int(day)  # Convert day to an integer
 
         # Check if a record with the same (store, day) already exists
         key = (store, day)
-        existing_record = existing_records.get(key)
+        existing_record = business_hours_objects.get(key)
 
         if existing_record:
             # Update the existing record with the new start_time_local and end_time_local
             if start_time_local != "00:00:00":
-                existing_record.start_time_local = datetime.strptime(
-                    start_time_local, "%H:%M:%S"
-                ).time()
+                existing_record.start_time_local = parse_time(start_time_local)
             if end_time_local != "23:59:59":
-                existing_record.end_time_local = datetime.strptime(
-                    end_time_local, "%H:%M:%S"
-                ).time()
+                existing_record.end_time_local = parse_time(end_time_local)
         else:
             # Create a new BusinessHours object with the parsed data
-            existing_record = BusinessHours(
+            business_hours_objects[key] = BusinessHours(
                 store=store,
                 day=day,
-                start_time_local=datetime.strptime(start_time_local, "%H:%M:%S").time(),
-                end_time_local=datetime.strptime(end_time_local, "%H:%M:%S").time(),
+                start_time_local=parse_time(start_time_local),
+                end_time_local=parse_time(end_time_local),
             )
 
-            # Add the new BusinessHours object to the list
-            business_hours_objects.append(existing_record)
-
-        # Update the existing_records dictionary
-        existing_records[key] = existing_record
-
-    return business_hours_objects
+    return business_hours_objects.values()
 
 
 def create_timezone_objects(csv_data):
     """
-    Creates Timezone objects from a list of CSV data rows.
+    Creates Timezone objects from CSV data rows.
 
-    This function iterates through the list of CSV data rows and creates corresponding Timezone objects.
+    This function iterates through the CSV data rows and creates corresponding Timezone objects.
     It ensures that each store has only one corresponding Timezone object.
 
     Args:
-        csv_data (list): A list of CSV data rows.
+        csv_data (iterator): An iterator of CSV data rows.
 
     Returns:
         list: A list of Timezone objects.
@@ -249,12 +287,8 @@ def create_timezone_objects(csv_data):
 
     timezone_objects = []
     store_timezones = {}  # Dictionary to store timezones by store
-    csv_data = list(csv_data)
-    total_rows = len(csv_data)
 
-    for i, row in tqdm(
-        enumerate(csv_data, 1), total=total_rows, desc="Processing timezones"
-    ):
+    for row in track_progress(csv_data, "Processing timezones"):
         store, timezone_str = row
 
         # Check if a timezone has already been assigned to the store
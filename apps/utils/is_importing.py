@@ -1,13 +1,35 @@
-import json
+from contextlib import contextmanager
+from multiprocessing import Value
+
+# Shared memory flag, inherited by the import and report processes forked from the server.
+# It is checked on every API request and only ever overwritten whole, so it is read without a lock.
+_is_importing = Value("b", False, lock=False)
+
+# Shared memory timestamp of the end of the last data import, 0 until one completes
+_last_import = Value("d", 0.0)
 
 
 def get_is_importing():
-    with open("is_importing.json", "r") as file:
-        data = json.load(file)
-        return data.get("is_importing")
+    return bool(_is_importing.value)
 
 
 def set_is_importing(value):
-    data = {"is_importing": value}
-    with open("is_importing.json", "w") as file:
-        json.dump(data, file)
+    _is_importing.value = value
+
+
+@contextmanager
+def importing():
+    # Raise the flag for the duration of an import, lowering it even if the import fails
+    set_is_importing(True)
+    try:
+        yield
+    finally:
+        set_is_importing(False)
+
+
+def get_last_import():
+    return _last_import.value
+
+
+def set_last_import(value):
+    _last_import.value = value
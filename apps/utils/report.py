@@ -1,69 +1,153 @@
-import multiprocessing
 import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 
+from django.db import connections
 from django.http import JsonResponse
 from rest_framework import status
 
 from apps.models import Report
 
+from .csv_generator import generate_csv_and_return_path
+from .is_importing import get_is_importing, get_last_import
 from .report_data import generate_store_data
 
+# Worker process generating reports one at a time, created on first use and reused across requests
+report_executor = None
+
 
 def create_report():
     """
     Create and save a new Report instance.
 
+    If a report has already been completed from the currently imported data, its store data and CSV file are reused
+    and the new report is completed right away, since the data only changes when it is imported again.
+
     Returns:
         Report: The newly created Report instance.
     """
-    report = Report()
+    # Reports created during an import get no data version, so they are never reused
+    if get_is_importing():
+        return Report.objects.create(data_version=None)
+
+    data_version = get_last_import()
+
+    # Look for a report completed since the last data import
+    cached_report = (
+        Report.objects.filter(
+            is_completed=True, data_version=data_version, csv_path__isnull=False
+        )
+        .order_by("-id")
+        .first()
+    )
+
+    if cached_report:
+        # The CSV file holds the same data, so it is shared as well
+        return Report.objects.create(
+            store_data=cached_report.store_data,
+            is_completed=True,
+            data_version=data_version,
+            csv_path=cached_report.csv_path,
+        )
+
+    report = Report(data_version=data_version)
     report.save()
     return report
 
 
+def get_report_executor():
+    """
+    Retrieve the pool of worker processes generating reports, creating it on first use.
+
+    Returns:
+        ProcessPoolExecutor: The pool of worker processes.
+    """
+    global report_executor
+
+    if report_executor is None:
+        # Close the database connections of the server before the workers are forked on first submit,
+        # so they open their own instead of inheriting sockets that closing would tear down for the server too
+        connections.close_all()
+        # A single worker, the report generation already spreads each report over every core
+        report_executor = ProcessPoolExecutor(max_workers=1)
+
+    return report_executor
+
+
 def generate_report_async(report):
     """
-    Trigger generate_report in a separate process using multiprocessing.
+    Trigger generate_report in a separate process of the report worker pool.
 
     Args:
         report (Report): The Report instance to be updated asynchronously.
     """
-    pool = multiprocessing.Pool()
-    pool.apply_async(generate_report, (report.set_store_data,))
-    pool.close()
+    future = get_report_executor().submit(generate_report, report.id)
+    future.add_done_callback(log_report_failure)
 
 
-def get_report_by_id(report_id):
+def log_report_failure(future):
+    """
+    Print the error of a report generation that failed, which would otherwise go unnoticed.
+
+    Args:
+        future (Future): The future of the generate_report call.
+    """
+    if future.cancelled() or future.exception() is None:
+        return
+
+    print("Report generation failed:")
+    traceback.print_exception(future.exception())
+
+
+def get_report_by_id(report_id, *fields):
     """
     Retrieve a Report instance by its ID.
 
     Args:
         report_id (int): The ID of the Report instance to be retrieved.
+        *fields (str): The fields to load, all of them if none is given. The others are deferred.
 
     Returns:
         Report: The retrieved Report instance if present else None.
     """
-    try:
-        report = Report.objects.get(id=report_id)
-    except Report.DoesNotExist:
-        return None
+    reports = Report.objects.filter(id=report_id)
 
-    return report
+    if fields:
+        reports = reports.only(*fields)
+
+    return reports.first()
 
 
-def generate_report(set_store_data_callback):
+def generate_report(report_id):
     """
-    Generate a Report with store data and update the provided callback.
+    Generate the store data and CSV file of a Report and save them.
 
     Args:
-        set_store_data_callback (function): The callback function to set store data.
+        report_id (int): The ID of the Report instance to be updated.
+
+    Raises:
+        Exception: Any error raised while generating the report, after marking the report as failed.
 
     Prints:
         str: A message indicating the success and time taken to generate the report.
     """
     print("Generating Report...")
     start_time = time.time()  # Record the start time
-    set_store_data_callback(generate_store_data())
-    end_time = time.time()  # Record the end time
-    elapsed_time = end_time - start_time
-    print(f"Report generated successfully. Time taken: {elapsed_time:.2f} seconds")
+
+    try:
+        report = Report.objects.get(id=report_id)
+        report.set_store_data(generate_store_data())
+
+        # A report may only be reused if no import ran while it was being generated
+        if get_is_importing() or get_last_import() != report.data_version:
+            report.data_version = None
+
+        # Write the CSV once here rather than every time the report is polled
+        report.complete(generate_csv_and_return_path(report))
+        end_time = time.time()  # Record the end time
+        elapsed_time = end_time - start_time
+        print(f"Report generated successfully. Time taken: {elapsed_time:.2f} seconds")
+    except Exception:
+        # Give the report a terminal state instead of leaving it running forever
+        Report.objects.filter(id=report_id).update(is_failed=True)
+        raise
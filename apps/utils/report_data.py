@@ -1,244 +1,215 @@
-import time
-from concurrent.futures import ThreadPoolExecutor
-from datetime import date, datetime, timedelta, timezone
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta, timezone
 from itertools import groupby
 from operator import itemgetter
 
-import pytz
+import numpy as np
 
 from apps.apps import StoremonitoringsystemConfig
 from apps.models import Store, StoreReport
 
-from .business_hours import get_business_hours_by_store
+from .business_hours import (
+    SECONDS_PER_DAY,
+    get_business_hours_for_stores,
+    get_default_business_hours_data,
+)
 
 # Number of intervals per hour for time granularity
 INTERVALS_PER_HOUR = 4
 
-# Dictionary to store date-weekday mapping
-date_weekday_mapping = {}
+# Length of an interval in seconds, minutes and hours
+INTERVAL_LENGTH = 3600 // INTERVALS_PER_HOUR
+MINUTES_PER_INTERVAL = 60 / INTERVALS_PER_HOUR
+HOURS_PER_INTERVAL = 1 / INTERVALS_PER_HOUR
 
+# Offsets of the intervals of a day from its start, built once and shared by every report
+INTERVAL_OFFSETS = np.arange(0, SECONDS_PER_DAY, INTERVAL_LENGTH, dtype=np.int64)
 
-def calculate_date_weekday_mapping():
-    """
-    Creates a dictionary mapping week days to corresponding dates based on the current timestamp.
+# Number of observation rows fetched from the database at a time
+OBSERVATIONS_CHUNK_SIZE = 10000
 
-    This function iterates through the days of the week, starting with the current day, and calculates
-    the corresponding dates based on the current timestamp. It stores these date-weekday mappings in a dictionary.
+# Number of stores handed to a worker process at a time
+STORES_PER_BATCH = 100
 
-    Returns:
-        dict: A dictionary mapping week days to corresponding dates.
+# Start of the date of each weekday within the last week, in seconds since the epoch
+weekday_midnights = np.zeros(7, dtype=np.int64)
+
+
+def calculate_weekday_midnights():
+    """
+    Calculates the start of the date of each weekday within the week ending at the current timestamp.
+
+    This function iterates through the days of the week, starting with the current day, and stores the start
+    of the corresponding date in `weekday_midnights`, as epoch seconds so reports only need integer arithmetic.
     """
 
     current_weekday = StoremonitoringsystemConfig.current_timestamp.weekday()
 
     # Iterate through the days of the week, starting with the current day
     for day in range(7):
-        # Calculate the corresponding date for the current day and store it in the dictionary
+        # Calculate the corresponding date for the current day and store its start
         date = (
             StoremonitoringsystemConfig.current_timestamp - timedelta(days=day)
         ).date()
-        date_weekday_mapping[(current_weekday - day) % 7] = date
-
-    return date_weekday_mapping
+        weekday_midnights[(current_weekday - day) % 7] = get_epoch_seconds(
+            datetime.combine(date, time.min)
+        )
 
 
-def get_weekday(item):
+def group_observations_by_date(timestamps, states, midnights, current_timestamp):
     """
-    Retrieves the weekday from an observation item.
+    Groups the recent observations by the date of their corresponding weekdays.
 
-    This function extracts the datetime object from the observation item and returns its weekday.
+    Observations older than one week from the current timestamp are left out. As the observations are sorted,
+    the observations of each day are a contiguous slice, so filtering and grouping come down to a single
+    binary search for the bounds of every day.
 
     Args:
-        item (tuple): An observation item containing a date and a timestamp.
+        timestamps (ndarray): The observation timestamps, in seconds since the epoch, sorted.
+        states (ndarray): The observation states, in the same order.
+        midnights (ndarray): The start of the date of each day of the week, in seconds since the epoch.
+        current_timestamp (datetime): The current timestamp.
 
     Returns:
-        int: The weekday of the date in the observation item.
-    """
-
-    observation_date = item[1]
-    weekday = observation_date.weekday()
-
-    return weekday
-
-
-def group_observations_by_date(observations):
+        dict: A dictionary mapping weekdays to tuples of timestamps and states for those weekdays.
     """
-    Groups observations by their corresponding weekdays.
-
-    This function utilizes the `groupby` function from the `itertools` module to group observations
-    based on their weekdays. It returns a dictionary where each key represents a weekday and
-    the corresponding value is a list of observations for that weekday.
 
-    Args:
-        observations (list): A list of observation items.
+    one_week_ago = get_epoch_seconds(current_timestamp - timedelta(days=7))
 
-    Returns:
-        dict: A dictionary mapping weekdays to lists of observations for those weekdays.
-    """
+    bounds = np.searchsorted(
+        timestamps,
+        np.concatenate(
+            (np.maximum(midnights, one_week_ago), midnights + SECONDS_PER_DAY)
+        ),
+    )
 
-    weekday_groups = groupby(observations, key=get_weekday)
-    grouped_observations = {weekday: list(group) for weekday, group in weekday_groups}
+    grouped_observations = {
+        day: (timestamps[first:last], states[first:last])
+        for day, (first, last) in enumerate(zip(bounds[:7], bounds[7:]))
+    }
 
     return grouped_observations
 
 
-def filter_recent_observations(observations, current_timestamp):
+def get_epoch_seconds(value):
     """
-    Filters observations to include only those that occurred within the past week.
-
-    This function removes observations that are older than one week from the provided list of observations.
-    It uses the current timestamp as a reference point and compares the observation timestamps to a date one week ago.
-    Only observations with timestamps on or after the one-week-ago date are retained.
+    Converts a naive UTC datetime to the number of seconds since the epoch.
 
     Args:
-        observations (list): A list of observation items.
-        current_timestamp (datetime): The current timestamp.
+        value (datetime): The naive datetime, in UTC.
 
     Returns:
-        list: A filtered list of observation items containing only recent observations.
-    """
-
-    one_week_ago = current_timestamp - timedelta(days=7)
-    recent_observations = []
-
-    for observation in observations:
-        observation_timestamp = observation[1]
-        if observation_timestamp.replace(tzinfo=pytz.UTC) >= one_week_ago.replace(
-            tzinfo=pytz.UTC
-        ):
-            recent_observations.append(observation)
-
-    return recent_observations
-
-
-def generate_time_intervals(start, end):
+        float: The number of seconds since the epoch.
     """
-    Generates a sequence of time intervals with specified granularity.
+    return value.replace(tzinfo=timezone.utc).timestamp()
 
-    This function creates a series of time intervals with equal lengths, starting from the provided start time
-    and ending at the specified end time. It utilizes the `timedelta` class to represent the interval length
-    and iterates until the end time is reached.
-
-    Args:
-        start (datetime): The start time of the time interval sequence.
-        end (datetime): The end time of the time interval sequence.
 
-    Returns:
-        generator: A generator yielding tuples of start and end times for each interval.
+def classify_week(grouped_observations, period_starts, period_ends):
     """
+    Classifies the time intervals of every day of the week based on the observations of each day.
 
-    interval_length = timedelta(minutes=60 // INTERVALS_PER_HOUR)
-    current_time = start
-
-    while current_time < end:
-        yield (current_time, current_time + interval_length)
-        current_time += interval_length
-
-
-def linear_interpolation(start_time, end_time, start_state, end_state, timestamp):
-    """
-    Performs linear interpolation to estimate the state at a given timestamp.
+    This function splits the period of each day into intervals and estimates the state at the start of each interval
+    by linearly interpolating between the two observations of that day that bracket it. Intervals that no pair of
+    observations brackets get a state of zero.
 
-    This function calculates the state value at a specified timestamp between two known state values based on the linear relationship
-    between the timestamp and the known state values. It assumes a uniform rate of change between the start and end states.
+    The days are interpolated together with a single `np.interp` call: each day is moved to its own lane, far enough
+    from the others that no pair of observations brackets an interval of another day.
 
     Args:
-        start_time (datetime): The timestamp for the start state.
-        end_time (datetime): The timestamp for the end state.
-        start_state (float): The state value at the start time.
-        end_state (float): The state value at the end time.
-        timestamp (datetime): The timestamp for which to estimate the state.
+        grouped_observations (dict): A dictionary mapping weekdays to tuples of sorted timestamps and states.
+        period_starts (ndarray): The start of the period of each day of the week, in seconds since the epoch.
+        period_ends (ndarray): The end of the period of each day of the week, in seconds since the epoch.
 
     Returns:
-        float: The estimated state value at the specified timestamp.
-    """
-
-    if start_time == end_time:
-        return start_state
-
-    # Calculate the alpha value based on the relative position of the timestamp
-    alpha = (timestamp - start_time) / (end_time - start_time)
-
-    # Estimate the state value using linear interpolation
-    interpolated_state = start_state + alpha * (end_state - start_state)
-
-    return interpolated_state
-
-
-def get_state_at_timestamp(timestamp, observations):
+        tuple: Three arrays holding the start time, estimated state and weekday of each interval,
+        with the times in seconds since the epoch.
     """
-    Determines the state value at a given timestamp based on available observations.
-
-    This function searches through a list of observations to find the two observations that bracket the provided timestamp.
-    If such observations are found, it applies linear interpolation to estimate the state value at the timestamp.
-    However, if no observations are found within the specified timestamp range, it returns False.
 
-    Args:
-        timestamp (datetime): The timestamp for which to determine the state.
-        observations (list): A list of observation items containing timestamps and state values.
+    # Take as many intervals of the precomputed grid as start before the end of the period of each day
+    interval_counts = np.searchsorted(INTERVAL_OFFSETS, period_ends - period_starts)
+    interval_days = np.repeat(np.arange(7), interval_counts)
+    first_intervals = np.cumsum(interval_counts) - interval_counts
+    interval_starts = (
+        period_starts[interval_days]
+        + INTERVAL_OFFSETS[
+            np.arange(len(interval_days)) - first_intervals[interval_days]
+        ]
+    )
 
-    Returns:
-        float or bool: The estimated state value at the timestamp, or False if no observation found.
-    """
+    # Interpolation needs a pair of observations to bracket an interval
+    lanes = [
+        (day, *grouped_observations[day])
+        for day in range(7)
+        if len(grouped_observations[day][0]) >= 2
+    ]
+    if not lanes:
+        return interval_starts, np.zeros_like(interval_starts), interval_days
+
+    first_timestamps = np.full(7, np.inf)
+    last_timestamps = np.full(7, -np.inf)
+    for day, timestamps, _ in lanes:
+        first_timestamps[day] = timestamps[0]
+        last_timestamps[day] = timestamps[-1]
+
+    timestamps = np.concatenate([lane[1] for lane in lanes])
+    states = np.concatenate([lane[2] for lane in lanes])
+    timestamp_days = np.repeat(
+        [lane[0] for lane in lanes], [len(lane[1]) for lane in lanes]
+    )
 
-    for i in range(len(observations) - 1):
-        current_observation_timestamp = observations[i][1].replace(tzinfo=pytz.UTC)
-        next_observation_timestamp = observations[i + 1][1].replace(tzinfo=pytz.UTC)
+    # Lay the days out one after the other, relative to the earliest time to keep the precision of the timestamps
+    times = np.concatenate((timestamps, interval_starts))
+    origin = times.min()
+    lane_width = times.max() - origin + 1
 
-        if current_observation_timestamp <= timestamp <= next_observation_timestamp:
-            start_observation = observations[i]
-            end_observation = observations[i + 1]
+    interval_states = np.interp(
+        interval_starts - origin + interval_days * lane_width,
+        timestamps - origin + timestamp_days * lane_width,
+        states,
+    )
 
-            return linear_interpolation(
-                start_observation[1],
-                end_observation[1],
-                start_observation[2],
-                end_observation[2],
-                timestamp,
-            )
+    # Only the intervals within the observations of their own day are bracketed
+    bracketed = (interval_starts >= first_timestamps[interval_days]) & (
+        interval_starts <= last_timestamps[interval_days]
+    )
+    interval_states = np.where(bracketed, interval_states, 0.0)
 
-    return False  # Default to False if no observation found
+    return interval_starts, interval_states, interval_days
 
 
-def classify_time_intervals(observations, start_utc, end_utc):
+def count_duration(selected, interval_duration):
     """
-    Classifies time intervals based on observations within a given period.
-
-    This function generates time intervals between start and end times and classifies each interval
-    based on the state value estimated at the midpoint of the interval.
+    Totals the duration of the selected intervals.
 
     Args:
-        observations (list): A list of observation items containing timestamps and state values.
-        start_utc (datetime): The start time of the interval.
-        end_utc (datetime): The end time of the interval.
+        selected (ndarray): A boolean mask of the intervals to total.
+        interval_duration (float): The duration of one interval.
 
     Returns:
-        list: A list of tuples containing start time, end time, and the estimated state for each interval.
+        float or int: The total duration of the selected intervals, in the unit of `interval_duration`,
+        or 0 if none is selected.
     """
 
-    intervals = list(generate_time_intervals(start_utc, end_utc))
-
-    result = []
+    interval_count = np.count_nonzero(selected)
 
-    for interval in intervals:
-        start_time, end_time = interval
-        state = get_state_at_timestamp(
-            start_time.replace(tzinfo=pytz.UTC), observations
-        )
-        result.append((start_time, end_time, state))
+    if not interval_count:
+        return 0
 
-    return result
+    return interval_count * interval_duration
 
 
 def calculate_uptime_downtime(classified_intervals):
     """
     Calculates uptime and downtime for different time periods based on classified intervals.
 
-    This function takes a dictionary of classified intervals for each weekday and calculates
-    uptime and downtime for the last hour, last day, and last week.
+    This function takes the classified intervals of the whole week and calculates
+    uptime and downtime for the last hour, last day, and last week, each by counting the intervals in a mask.
 
     Args:
-        classified_intervals (dict): A dictionary mapping weekdays to classified intervals.
+        classified_intervals (tuple): The start times, states and weekdays of the intervals,
+            as returned by `classify_week`.
 
     Returns:
         dict: A dictionary containing uptime and downtime values for different time periods.
@@ -246,41 +217,26 @@ def calculate_uptime_downtime(classified_intervals):
 
     now = StoremonitoringsystemConfig.current_timestamp
     current_weekday = now.weekday()  # 0=Monday, 6=Sunday
-    last_hour_start = now - timedelta(hours=1)
-    last_day_start = now - timedelta(days=1)
-    last_week_start = now - timedelta(weeks=1)
-
-    uptime_last_hour = downtime_last_hour = 0
-    uptime_last_day = downtime_last_day = 0
-    uptime_last_week = downtime_last_week = 0
-
-    for weekday, result in classified_intervals.items():
-        for interval in result:
-            start_time, end_time, state = interval
-            if start_time >= last_week_start:
-                if state:
-                    uptime_last_week += (end_time - start_time).total_seconds() / 3600
-                else:
-                    downtime_last_week += (end_time - start_time).total_seconds() / 3600
-
-            if weekday == current_weekday:
-                if start_time >= last_hour_start:
-                    if state:
-                        uptime_last_hour += (end_time - start_time).total_seconds() / 60
-                    else:
-                        downtime_last_hour += (
-                            end_time - start_time
-                        ).total_seconds() / 60
-
-                if start_time >= last_day_start:
-                    if state:
-                        uptime_last_day += (
-                            end_time - start_time
-                        ).total_seconds() / 3600
-                    else:
-                        downtime_last_day += (
-                            end_time - start_time
-                        ).total_seconds() / 3600
+    last_hour_start = get_epoch_seconds(now - timedelta(hours=1))
+    last_day_start = get_epoch_seconds(now - timedelta(days=1))
+    last_week_start = get_epoch_seconds(now - timedelta(weeks=1))
+
+    starts, states, weekdays = classified_intervals
+    up = states != 0
+    down = ~up
+
+    last_week = starts >= last_week_start
+    today = weekdays == current_weekday
+    last_hour = today & (starts >= last_hour_start)
+    last_day = today & (starts >= last_day_start)
+
+    # Intervals all have the same length, so the totals come down to counting them
+    uptime_last_hour = count_duration(up & last_hour, MINUTES_PER_INTERVAL)
+    downtime_last_hour = count_duration(down & last_hour, MINUTES_PER_INTERVAL)
+    uptime_last_day = count_duration(up & last_day, HOURS_PER_INTERVAL)
+    downtime_last_day = count_duration(down & last_day, HOURS_PER_INTERVAL)
+    uptime_last_week = count_duration(up & last_week, HOURS_PER_INTERVAL)
+    downtime_last_week = count_duration(down & last_week, HOURS_PER_INTERVAL)
 
     return {
         "uptime_last_hour": uptime_last_hour,
@@ -292,7 +248,7 @@ def calculate_uptime_downtime(classified_intervals):
     }
 
 
-def generate_store_report(store_id, observations):
+def generate_store_report(store_id, timestamps, states, business_hours_data):
     """
     Generates a store report based on observations for a specific store.
 
@@ -301,30 +257,29 @@ def generate_store_report(store_id, observations):
 
     Args:
         store_id (int): The identifier of the store.
-        observations (list): A list of observation items containing timestamps and state values.
+        timestamps (ndarray): The observation timestamps, in seconds since the epoch, sorted.
+        states (ndarray): The observation states, in the same order.
+        business_hours_data (tuple): The start and end of the business hours of the store for each day of the week,
+            in seconds since midnight UTC.
 
     Returns:
         StoreReport: An object containing uptime and downtime information for the store.
     """
 
-    business_hours_data = get_business_hours_by_store(store_id)
-    recent_observations = filter_recent_observations(
-        observations, StoremonitoringsystemConfig.current_timestamp
+    starts, ends = business_hours_data
+
+    grouped_observations = group_observations_by_date(
+        timestamps,
+        states,
+        weekday_midnights,
+        StoremonitoringsystemConfig.current_timestamp,
+    )
+
+    classified_intervals = classify_week(
+        grouped_observations,
+        weekday_midnights + starts,
+        weekday_midnights + ends,
     )
-    grouped_observations = group_observations_by_date(recent_observations)
-
-    classified_intervals = {
-        day: classify_time_intervals(
-            grouped_observations.get(day, []),
-            datetime.combine(
-                date_weekday_mapping[day], business_hours_data[day]["start_utc"]
-            ),
-            datetime.combine(
-                date_weekday_mapping[day], business_hours_data[day]["end_utc"]
-            ),
-        )
-        for day in range(7)
-    }
 
     uptime_downtime_summary = calculate_uptime_downtime(classified_intervals)
 
@@ -341,7 +296,7 @@ def process_store_group(args):
     It handles any exceptions that may occur during the processing and prints an error message.
 
     Args:
-        args (tuple): A tuple containing store_id and observations.
+        args (tuple): A tuple containing store_id, observation timestamps, observation states and business hours data.
 
     Returns:
         StoreReport or None: An object containing uptime and downtime information for the store,
@@ -349,8 +304,10 @@ def process_store_group(args):
     """
 
     try:
-        store_id, observations = args
-        store_report = generate_store_report(store_id, observations)
+        store_id, timestamps, states, business_hours_data = args
+        store_report = generate_store_report(
+            store_id, timestamps, states, business_hours_data
+        )
         return store_report
     except Exception as e:
         # Capture and handle the error
@@ -358,34 +315,92 @@ def process_store_group(args):
         # You can also log the error or raise it further
 
 
+def process_store_groups(store_groups):
+    """
+    Processes a batch of store groups in a worker process.
+
+    Args:
+        store_groups (list): A list of tuples, as taken by `process_store_group`.
+
+    Returns:
+        list: The result of `process_store_group` for each store group, in order.
+    """
+    return [process_store_group(store_group) for store_group in store_groups]
+
+
 def generate_store_data():
     """
     Generates store data by processing observations for multiple stores in parallel.
 
-    This function fetches all store data including timestamp and activity status,
-    groups the stores by store_id, calculates the date-weekday mapping, and then processes each
-    store group asynchronously using ThreadPoolExecutor.
+    This function streams all store data including timestamp and activity status, ordered by store,
+    and hands the observations of each store to a ProcessPoolExecutor in batches as soon as they are read.
+    Only a bounded number of batches is in flight at a time, so memory usage does not grow with the
+    number of observations.
 
     Returns:
         list: A list of StoreReport objects containing uptime and downtime information for each store.
     """
 
-    # Fetch all store data including timestamp and activity status
-    all_stores_data = Store.objects.values_list(
-        "store", "timestamp_utc", "is_active"
-    ).order_by("store", "timestamp_utc")
+    # Fetch the business hours of every store in bulk, stores without any are open 24*7
+    business_hours_by_store = get_business_hours_for_stores()
+    default_business_hours = tuple(map(tuple, get_default_business_hours_data()))
 
-    # Group the stores by store_id
-    grouped_stores = [
-        (key, list(group)) for key, group in groupby(all_stores_data, key=itemgetter(0))
-    ]
+    # Stream all store data including timestamp and activity status. The database sorts it once, using the
+    # (store, timestamp_utc) unique index, and every later step relies on that order instead of sorting again
+    all_stores_data = (
+        Store.objects.values_list("store", "timestamp_utc", "is_active")
+        .order_by("store", "timestamp_utc")
+        .iterator(chunk_size=OBSERVATIONS_CHUNK_SIZE)
+    )
+
+    # The work is CPU bound, so spread it over processes rather than threads held back by the GIL,
+    # keeping a few batches queued for each worker
+    workers = os.cpu_count()
+    max_pending_batches = workers * 4
+
+    store_data_by_id = []
+    pending_batches = deque()
+
+    # Each worker calculates the weekday midnights on startup
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=calculate_weekday_midnights
+    ) as executor:
+        # Start the workers before the query runs, so they are not forked with its cursor open
+        executor.submit(calculate_weekday_midnights).result()
+
+        batch = []
+        for store_id, rows in groupby(all_stores_data, key=itemgetter(0)):
+            rows = list(rows)
+            timestamps = np.fromiter(
+                (row[1].timestamp() for row in rows), dtype=np.float64, count=len(rows)
+            )
+            states = np.fromiter(
+                map(itemgetter(2), rows), dtype=np.float64, count=len(rows)
+            )
+            batch.append(
+                (
+                    store_id,
+                    timestamps,
+                    states,
+                    business_hours_by_store.get(store_id, default_business_hours),
+                )
+            )
+
+            if len(batch) == STORES_PER_BATCH:
+                pending_batches.append(executor.submit(process_store_groups, batch))
+                batch = []
 
-    # Calculate the date-weekday mapping
-    calculate_date_weekday_mapping()
+            # Wait for the oldest batch once enough are queued, which also keeps the stores in order
+            if len(pending_batches) > max_pending_batches:
+                store_data_by_id.extend(pending_batches.popleft().result())
 
-    # Use ThreadPoolExecutor for parallel processing
-    with ThreadPoolExecutor() as executor:
-        # Process each store group asynchronously
-        store_data_by_id = list(executor.map(process_store_group, grouped_stores))
+        if batch:
+            pending_batches.append(executor.submit(process_store_groups, batch))
 
-    return store_data_by_id
+        for pending_batch in pending_batches:
+            store_data_by_id.extend(pending_batch.result())
+
+    # Leave out the stores that failed to process
+    return [
+        store_report for store_report in store_data_by_id if store_report is not None
+    ]
@@ -1,10 +1,10 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 from .apps import StoremonitoringsystemConfig
-from .utils.csv_generator import generate_csv_and_return_path
+from .utils.csv_generator import generate_csv_and_return_path, stream_csv
 from .utils.report import create_report, generate_report_async, get_report_by_id
 from .utils.is_importing import get_is_importing
 
@@ -26,8 +26,9 @@ def trigger_report(request):
     # Create a new Report instance
     report = create_report()
 
-    # Trigger generate_report in a separate process using multiprocessing
-    generate_report_async(report)
+    # Trigger generate_report in a separate process unless the report was reused from the current data
+    if not report.is_completed:
+        generate_report_async(report)
 
     return JsonResponse({"report_id": report.id}, status=status.HTTP_201_CREATED)
 
@@ -44,6 +45,48 @@ def get_report(request, report_id):
         JsonResponse or Response: A JsonResponse indicating the status of the report or a Response containing the CSV path.
     """
 
+    if get_is_importing():
+        return JsonResponse(
+            {"error": "Data is still being loaded, please wait for some time."},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+    # The store data is left in the database, the response only needs the status and CSV path
+    report = get_report_by_id(report_id, "is_completed", "is_failed", "csv_path")
+
+    if not report:
+        return JsonResponse(
+            {"error": "Report not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    if report.is_failed:
+        return JsonResponse(
+            {"status": "Failed"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    if not report.is_completed:
+        return JsonResponse({"status": "Running"}, status=status.HTTP_202_ACCEPTED)
+
+    if report.csv_path is None:
+        # Reports completed before CSV paths were stored get their CSV written on first request
+        report.csv_path = generate_csv_and_return_path(report)
+        report.save(update_fields=["csv_path"])
+
+    return Response({"status": "Complete", "csv_path": report.csv_path})
+
+
+@api_view(["GET"])
+def download_report(request, report_id):
+    """
+    Stream the CSV of a completed report without writing it to disk.
+
+    Args:
+        report_id (int): The ID of the report to download.
+
+    Returns:
+        JsonResponse or StreamingHttpResponse: A JsonResponse indicating the status of the report or a StreamingHttpResponse containing the CSV.
+    """
+
     if get_is_importing():
         return JsonResponse(
             {"error": "Data is still being loaded, please wait for some time."},
@@ -57,8 +100,16 @@ def get_report(request, report_id):
             {"error": "Report not found"}, status=status.HTTP_404_NOT_FOUND
         )
 
+    if report.is_failed:
+        return JsonResponse(
+            {"status": "Failed"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
     if not report.is_completed:
         return JsonResponse({"status": "Running"}, status=status.HTTP_202_ACCEPTED)
 
-    csv_path = generate_csv_and_return_path(report)
-    return Response({"status": "Complete", "csv_path": csv_path})
+    return StreamingHttpResponse(
+        stream_csv(report),
+        content_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{report.id}.csv"'},
+    )